@@ -0,0 +1,182 @@
+import time
+import random
+import shutil
+import argparse
+import tempfile
+import threading
+import multiprocessing
+
+from search_index import SearchIndex
+
+ACTIONS = ["login", "logout", "upload", "download", "delete", "update", "export", "payment"]
+ERRORS = ["timeout", "connection_refused", "permission_denied", "disk_full", "not_found", "rate_limited"]
+USERS = 50000
+
+def make_text(i):
+    # "entry {i}" gives every log a unique token, so the term dictionary
+    # grows with the number of logs, like request ids in real traffic.
+    user = f"user_{random.randint(1, USERS)}"
+    if random.random() < 0.05:
+        return f"Log entry {i}: {random.choice(ACTIONS)} failed for {user} with error {random.choice(ERRORS)}. Call [REDACTED]"
+    return f"Log entry {i}: {user} performed {random.choice(ACTIONS)} successfully. Contact [REDACTED]"
+
+def build_index(root, docs, tenant_id):
+    index = SearchIndex(root)
+    start = time.time()
+    for i in range(docs):
+        index.add(tenant_id, f"log-{i}", make_text(i))
+        if (i + 1) % 100000 == 0:
+            print(f"  indexed {i + 1} logs")
+            index.merge()
+    index.flush()
+    index.merge()
+    print(f"Indexed {docs} logs in {time.time() - start:.1f}s")
+    index.close()
+
+def percentiles(latencies):
+    latencies = sorted(latencies)
+    return latencies[len(latencies) // 2], latencies[int(len(latencies) * 0.99) - 1]
+
+def time_cold_queries(root, tenant_id, rounds):
+    """First query on a freshly opened reader, and right after the writer flushes."""
+    print(f"\n{'Cold query':<40} {'p50 ms':>8} {'p99 ms':>8}")
+    opened = []
+    for _ in range(rounds):
+        index = SearchIndex(root)
+        start = time.perf_counter()
+        index.search(tenant_id, f"user_{random.randint(1, USERS)}")
+        opened.append((time.perf_counter() - start) * 1000)
+        index.close()
+    print(f"{'first query after open':<40} {percentiles(opened)[0]:>8.2f} {percentiles(opened)[1]:>8.2f}")
+
+    reader = SearchIndex(root)
+    writer = SearchIndex(root)
+    reader.search(tenant_id, "timeout")
+    refreshed = []
+    next_id = 0
+    for _ in range(min(rounds, 50)):
+        for _ in range(100):
+            writer.add(tenant_id, f"refresh-{next_id}", make_text(next_id))
+            next_id += 1
+        writer.flush()
+        start = time.perf_counter()
+        reader.search(tenant_id, f"user_{random.randint(1, USERS)}")
+        refreshed.append((time.perf_counter() - start) * 1000)
+    print(f"{'first query after flush':<40} {percentiles(refreshed)[0]:>8.2f} {percentiles(refreshed)[1]:>8.2f}")
+    writer.close()
+    reader.close()
+
+def ingest(root, tenant_id, stop, added):
+    """Adds logs until stopped, flushing every 1000 and merging after each flush."""
+    writer = SearchIndex(root, flush_docs=1000)
+    while not stop.is_set():
+        writer.add(tenant_id, f"live-{added.value}", make_text(added.value))
+        added.value += 1
+        if added.value % 1000 == 0:
+            writer.merge()
+    writer.close()
+
+def time_concurrent_queries(root, tenant_id, queries, seconds, use_process):
+    """
+    Query latency while a writer adds, flushes and merges. A writer thread
+    shares the GIL with the queries; a writer process matches the deployment,
+    where the worker and the API are separate processes.
+    """
+    if use_process:
+        stop = multiprocessing.Event()
+        added = multiprocessing.Value("l", 0)
+        writer = multiprocessing.Process(target=ingest, args=(root, tenant_id, stop, added))
+    else:
+        stop = threading.Event()
+        added = multiprocessing.Value("l", 0, lock=False)
+        writer = threading.Thread(target=ingest, args=(root, tenant_id, stop, added))
+    writer.start()
+
+    reader = SearchIndex(root)
+    latencies = []
+    deadline = time.time() + seconds
+    while time.time() < deadline:
+        q, _ = random.choice(queries)
+        query = q() if callable(q) else q
+        start = time.perf_counter()
+        reader.search(tenant_id, query, 50)
+        latencies.append((time.perf_counter() - start) * 1000)
+    stop.set()
+    writer.join()
+    reader.close()
+
+    p50, p99 = percentiles(latencies)
+    label = f"during ingest ({'process' if use_process else 'thread'})"
+    print(f"{label:<40} {p50:>8.2f} {p99:>8.2f}  {len(latencies)} queries, {added.value} logs added")
+
+def time_queries(index, tenant_id, queries, rounds):
+    print(f"\n{'Query':<40} {'Hits/page':>9} {'p50 ms':>8} {'p99 ms':>8}")
+    for q, paged in queries:
+        latencies = []
+        hits = 0
+        for _ in range(rounds):
+            query = q() if callable(q) else q
+            cursor = None
+            start = time.perf_counter()
+            log_ids, cursor = index.search(tenant_id, query, 50)
+            if paged and cursor is not None:
+                # Fetch a page deep into the results
+                for _ in range(10):
+                    if cursor is None:
+                        break
+                    log_ids, cursor = index.search(tenant_id, query, 50, cursor)
+            latencies.append((time.perf_counter() - start) * 1000)
+            hits = len(log_ids)
+        label = (q.__doc__ if callable(q) else q) + (" (11 pages)" if paged else "")
+        p50, p99 = percentiles(latencies)
+        print(f"{label:<40} {hits:>9} {p50:>8.2f} {p99:>8.2f}")
+
+def run_benchmark(docs, rounds, keep, concurrent_seconds):
+    random.seed(42)
+    root = tempfile.mkdtemp(prefix="search_index_")
+    tenant_id = "acme"
+    print(f"Building index for {docs} logs in {root}")
+    build_index(root, docs, tenant_id)
+
+    def random_user():
+        """random user"""
+        return f"user_{random.randint(1, USERS)}"
+
+    def random_user_error():
+        """random user + failed"""
+        return f"failed user_{random.randint(1, USERS)}"
+
+    queries = [
+        (random_user, False),
+        (random_user_error, False),
+        ("timeout", False),
+        ("timeout", True),
+        ("redacted", False),
+        ("disk_full payment", False),
+        # Both words are frequent but never in the same log
+        ("successfully failed", False),
+        ("no_such_token", False),
+    ]
+
+    # Separate reader, as in the API process
+    time_cold_queries(root, tenant_id, rounds)
+    index = SearchIndex(root)
+    time_queries(index, tenant_id, queries, rounds)
+    index.close()
+    print(f"\nMixed queries, {concurrent_seconds}s each")
+    print(f"{'Writer':<40} {'p50 ms':>8} {'p99 ms':>8}")
+    time_concurrent_queries(root, tenant_id, queries, concurrent_seconds, use_process=False)
+    time_concurrent_queries(root, tenant_id, queries, concurrent_seconds, use_process=True)
+
+    if not keep:
+        shutil.rmtree(root)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Search Index Benchmark")
+    parser.add_argument("--docs", type=int, default=1000000, help="Number of logs to index")
+    parser.add_argument("--rounds", type=int, default=200, help="Runs per query")
+    parser.add_argument("--keep", action="store_true", help="Keep the index directory")
+    parser.add_argument("--concurrent", type=int, default=20, help="Seconds to query during concurrent ingest")
+
+    args = parser.parse_args()
+    run_benchmark(args.docs, args.rounds, args.keep, args.concurrent)
@@ -1,11 +1,16 @@
 import os
 import json
+import uuid
+import asyncio
 import logging
-from typing import Optional, Dict, Any
-from fastapi import FastAPI, HTTPException, Request, Response, status, Header
-from pydantic import BaseModel
+import threading
+from typing import Optional, Dict, Any, Callable
+from fastapi import FastAPI, HTTPException, Request, Response, status, Header, Query, WebSocket, WebSocketDisconnect
+from fastapi.websockets import WebSocketState
+from pydantic import BaseModel, StrictStr
 from google.cloud import pubsub_v1
 from dotenv import load_dotenv
+from search_index import SearchIndex
 
 # Load environment variables
 load_dotenv()
@@ -24,13 +29,30 @@ app = FastAPI(title="Data Ingestion API")
 PROJECT_ID = os.getenv("GCP_PROJECT")
 TOPIC_ID = os.getenv("PUBSUB_TOPIC")
 
+# Process-wide limit on unacknowledged publishes, shared by /ingest and every
+# /ingest/stream connection. The publisher's flow control uses the same limit.
+PUBLISH_MAX_IN_FLIGHT = int(os.getenv("PUBLISH_MAX_IN_FLIGHT", "1000"))
+# Part of PUBLISH_MAX_IN_FLIGHT that stream connections never reserve, so a
+# few busy or idle streams cannot lock /ingest out.
+PUBLISH_HTTP_RESERVE = int(os.getenv("PUBLISH_HTTP_RESERVE", str(PUBLISH_MAX_IN_FLIGHT // 4)))
+PUBLISH_MAX_IN_FLIGHT_BYTES = int(os.getenv("PUBLISH_MAX_IN_FLIGHT_BYTES", str(100 * 1024 * 1024)))
+
+publisher_options = pubsub_v1.types.PublisherOptions(
+    flow_control=pubsub_v1.types.PublishFlowControl(
+        message_limit=PUBLISH_MAX_IN_FLIGHT,
+        byte_limit=PUBLISH_MAX_IN_FLIGHT_BYTES,
+        limit_exceeded_behavior=pubsub_v1.types.LimitExceededBehavior.ERROR,
+    )
+)
+
 # Check if running in emulator
 if os.getenv("PUBSUB_EMULATOR_HOST"):
     publisher = pubsub_v1.PublisherClient(
+        publisher_options=publisher_options,
         client_options={"api_endpoint": os.getenv("PUBSUB_EMULATOR_HOST")}
     )
 else:
-    publisher = pubsub_v1.PublisherClient()
+    publisher = pubsub_v1.PublisherClient(publisher_options=publisher_options)
 
 if PROJECT_ID and TOPIC_ID:
     topic_path = publisher.topic_path(PROJECT_ID, TOPIC_ID)
@@ -38,6 +60,27 @@ else:
     logger.warning("GCP_PROJECT or PUBSUB_TOPIC not set. Pub/Sub publishing will fail.")
     topic_path = None
 
+# Upper bound on the credit a single /ingest/stream connection holds. Each
+# connection's share of PUBLISH_MAX_IN_FLIGHT is also capped by the number of
+# open streams.
+STREAM_MAX_IN_FLIGHT = int(os.getenv("STREAM_MAX_IN_FLIGHT", "1000"))
+# Seconds a client has to send its tenant frame when X-Tenant-ID is not set.
+STREAM_HELLO_TIMEOUT = float(os.getenv("STREAM_HELLO_TIMEOUT", "10"))
+# Credit held by a stream that is not sending. A stream is granted its full
+# share once records arrive, and unused credit above this is taken back after
+# STREAM_IDLE_SECONDS without records.
+STREAM_IDLE_CREDIT = int(os.getenv("STREAM_IDLE_CREDIT", "10"))
+STREAM_IDLE_SECONDS = float(os.getenv("STREAM_IDLE_SECONDS", "1"))
+# Seconds a stream whose publish failed waits for earlier records to complete
+# before closing.
+STREAM_DRAIN_TIMEOUT = float(os.getenv("STREAM_DRAIN_TIMEOUT", "10"))
+# How often a stream rebalances its credit against its share.
+STREAM_CREDIT_POLL = 0.05
+
+# Inverted index over processed logs, maintained by the worker on shared storage.
+SEARCH_INDEX_DIR = os.getenv("SEARCH_INDEX_DIR")
+search_index = SearchIndex(SEARCH_INDEX_DIR) if SEARCH_INDEX_DIR else None
+
 class LogPayload(BaseModel):
     """
     Pydantic model for JSON payload validation.
@@ -46,10 +89,99 @@ class LogPayload(BaseModel):
     log_id: str
     text: str
 
+class StreamHello(BaseModel):
+    """
+    Pydantic model for the tenant frame opening an /ingest/stream connection
+    without an X-Tenant-ID header.
+    """
+    tenant_id: StrictStr
+
+class StreamRecord(BaseModel):
+    """
+    Pydantic model for a single record frame on /ingest/stream.
+    The tenant is fixed for the connection, and log_id is generated if omitted.
+    """
+    log_id: Optional[str] = None
+    text: str
+
+class PublishBudget:
+    """
+    Counts in-flight publishes against PUBLISH_MAX_IN_FLIGHT.
+    Stream units are also counted against limit - reserve, leaving the
+    reserve for /ingest. Units are released from publisher callback threads,
+    hence the lock.
+    """
+    def __init__(self, limit: int, reserve: int = 0):
+        self.limit = limit
+        self.stream_limit = max(1, limit - reserve)
+        self.in_flight = 0
+        self.stream_in_flight = 0
+        self.streams = 0
+        self._lock = threading.Lock()
+
+    def acquire(self, n: int = 1, stream: bool = False) -> int:
+        """Reserves up to n units and returns how many were reserved."""
+        with self._lock:
+            available = self.limit - self.in_flight
+            if stream:
+                available = min(available, self.stream_limit - self.stream_in_flight)
+            granted = max(0, min(n, available))
+            self.in_flight += granted
+            if stream:
+                self.stream_in_flight += granted
+            return granted
+
+    def release(self, n: int = 1, stream: bool = False):
+        with self._lock:
+            self.in_flight -= n
+            if stream:
+                self.stream_in_flight -= n
+
+    def stream_share(self) -> int:
+        """Credit target for each open stream connection."""
+        return max(1, min(STREAM_MAX_IN_FLIGHT, self.stream_limit // max(self.streams, 1)))
+
+publish_budget = PublishBudget(PUBLISH_MAX_IN_FLIGHT, PUBLISH_HTTP_RESERVE)
+
 def get_correlation_id(log_id: str) -> Dict[str, str]:
     """Helper to add correlation_id to log records."""
     return {"correlation_id": log_id}
 
+def build_envelope(tenant_id: str, log_id: str, text: str, source: str) -> Dict[str, Any]:
+    """Normalizes a record into the message envelope consumed by the worker."""
+    return {
+        "tenant_id": tenant_id,
+        "log_id": log_id,
+        "text": text,
+        "source": source
+    }
+
+def publish_envelope(normalized_data: Dict[str, Any], on_done: Optional[Callable] = None, stream: bool = False):
+    """
+    Publishes a normalized envelope to Pub/Sub without waiting for the result.
+    The caller must hold one publish_budget unit (a stream unit if stream is
+    set), which is released when the publish completes. Publish errors are logged; on_done, if given, is also
+    called with the completed future (on the publisher's thread).
+    """
+    data_bytes = json.dumps(normalized_data).encode("utf-8")
+    try:
+        future = publisher.publish(topic_path, data_bytes, tenant_id=normalized_data['tenant_id'])
+    except Exception:
+        publish_budget.release(stream=stream)
+        raise
+
+    def callback(f):
+        publish_budget.release(stream=stream)
+        try:
+            f.result()
+        except Exception as e:
+            logger.error(f"Publishing failed for {normalized_data['log_id']}: {e}", extra=get_correlation_id(normalized_data['log_id']))
+        if on_done:
+            on_done(f)
+
+    future.add_done_callback(callback)
+    return future
+
 @app.get("/")
 async def health_check():
     """
@@ -78,12 +210,7 @@ async def ingest_log(
                 payload = await request.json()
                 # Validate using Pydantic
                 log_data = LogPayload(**payload)
-                normalized_data = {
-                    "tenant_id": log_data.tenant_id,
-                    "log_id": log_data.log_id,
-                    "text": log_data.text,
-                    "source": "json"
-                }
+                normalized_data = build_envelope(log_data.tenant_id, log_data.log_id, log_data.text, "json")
             except Exception as e:
                 logger.error(f"Invalid JSON payload: {str(e)}", extra={"correlation_id": "unknown"})
                 raise HTTPException(status_code=400, detail=f"Invalid JSON: {str(e)}")
@@ -97,15 +224,9 @@ async def ingest_log(
             body = await request.body()
             text_content = body.decode("utf-8")
             # Generate a simple log_id if not provided (could be improved)
-            import uuid
             log_id = str(uuid.uuid4())
             
-            normalized_data = {
-                "tenant_id": x_tenant_id,
-                "log_id": log_id,
-                "text": text_content,
-                "source": "text"
-            }
+            normalized_data = build_envelope(x_tenant_id, log_id, text_content, "text")
         else:
             raise HTTPException(status_code=400, detail="Unsupported Content-Type")
 
@@ -117,28 +238,13 @@ async def ingest_log(
 
         # Publish to Pub/Sub
         if topic_path:
-            data_str = json.dumps(normalized_data)
-            data_bytes = data_str.encode("utf-8")
-            
-            # Publish asynchronously
-            future = publisher.publish(topic_path, data_bytes, tenant_id=normalized_data['tenant_id'])
-            # We don't wait for the result to keep it non-blocking/fast for the client
-            # In a real prod scenario, we might want to handle publish errors more robustly
-            # or use a callback, but for high throughput 202, fire-and-forget is often acceptable
-            # if we trust the infrastructure. 
-            # However, to be 'robust', let's add a callback to log errors.
-            
-            def get_callback(f, data):
-                def callback(f):
-                    try:
-                        f.result()
-                        # Success logging is verbose for high throughput, maybe debug level
-                        # logger.debug(f"Published message {data['log_id']}")
-                    except Exception as e:
-                        logger.error(f"Publishing failed for {data['log_id']}: {e}", extra=get_correlation_id(data['log_id']))
-                return callback
-
-            future.add_done_callback(get_callback(future, normalized_data))
+            if not publish_budget.acquire():
+                logger.error("Publish budget exhausted", extra=get_correlation_id(normalized_data['log_id']))
+                raise HTTPException(status_code=503, detail="Too many in-flight publishes, retry later")
+
+            # Publish asynchronously. We don't wait for the result to keep it
+            # non-blocking/fast for the client; publish errors are logged.
+            publish_envelope(normalized_data)
             
             logger.info("Message published to Pub/Sub", extra=get_correlation_id(normalized_data['log_id']))
         else:
@@ -152,3 +258,251 @@ async def ingest_log(
     except Exception as e:
         logger.error(f"Internal error: {str(e)}", extra={"correlation_id": "unknown"})
         raise HTTPException(status_code=500, detail="Internal Server Error")
+
+@app.websocket("/ingest/stream")
+async def ingest_stream(websocket: WebSocket):
+    """
+    Long-lived streaming ingest for high-rate agents.
+
+    The tenant is authenticated once per connection, via the X-Tenant-ID
+    handshake header or a first frame of {"tenant_id": "..."} sent within
+    STREAM_HELLO_TIMEOUT seconds. Each following text frame is one JSON record
+    ({"text": ..., "log_id": optional}) and is implicitly numbered 1, 2, 3...
+    in arrival order.
+
+    Server frames:
+    - {"type": "ready", "tenant_id": ..., "credit": N}: initial credit grant.
+    - {"type": "ack", "seq": N, "credit": k}: cumulative ack; every record up
+      to seq N has been published (or rejected), and k more records may be
+      sent. A negative k takes back unused credit.
+    - {"type": "error", "seq": N, "detail": ...}: record N was rejected as
+      invalid. It still counts towards the cumulative ack and is not retried.
+
+    Credit is reserved from the process-wide publish_budget, so all streams
+    together never exceed PUBLISH_MAX_IN_FLIGHT - PUBLISH_HTTP_RESERVE. A
+    stream starts with STREAM_IDLE_CREDIT, is granted its share of the budget
+    while it sends, and is shrunk back when it goes idle or when more streams
+    open.
+
+    Sending more records than granted credit closes the connection with 1008,
+    unless the record crossed a credit reduction in flight and the stream is
+    still within its share.
+    A failed publish closes it with 1011 once every earlier record has
+    completed (or after STREAM_DRAIN_TIMEOUT); clients resend from the last
+    ack + 1.
+    """
+    await websocket.accept()
+
+    if not topic_path:
+        logger.error("Pub/Sub topic not configured", extra={"correlation_id": "unknown"})
+        await websocket.close(code=status.WS_1011_INTERNAL_ERROR, reason="Server misconfiguration")
+        return
+
+    try:
+        tenant_id = websocket.headers.get("x-tenant-id")
+        if not tenant_id:
+            hello = json.loads(await asyncio.wait_for(websocket.receive_text(), STREAM_HELLO_TIMEOUT))
+            tenant_id = StreamHello(**hello).tenant_id
+    except WebSocketDisconnect:
+        return
+    except Exception:
+        tenant_id = None
+
+    if not tenant_id:
+        logger.error("Missing tenant for stream connection", extra={"correlation_id": "unknown"})
+        await websocket.close(code=status.WS_1008_POLICY_VIOLATION, reason="X-Tenant-ID header or tenant_id frame required")
+        return
+
+    loop = asyncio.get_running_loop()
+    # (seq, error) pairs, fed from publisher callbacks and invalid records
+    completions: asyncio.Queue = asyncio.Queue()
+    # granted: credit held by the client; in_flight: records not yet completed.
+    # Both are reserved in publish_budget. last_record: loop time of the last
+    # record, used to shrink the credit of idle streams.
+    # closing: set once a publish failed and the stream is draining.
+    state = {"granted": 0, "in_flight": 0, "last_record": None, "closing": False}
+
+    def completion_callback(seq: int) -> Callable:
+        def on_done(f):
+            try:
+                f.result()
+                error = None
+            except Exception as e:
+                error = e
+            try:
+                loop.call_soon_threadsafe(completions.put_nowait, (seq, error))
+            except RuntimeError:
+                # Event loop already closed; the connection is gone.
+                pass
+        return on_done
+
+    def credit_target() -> int:
+        share = publish_budget.stream_share()
+        last_record = state["last_record"]
+        if last_record is not None and loop.time() - last_record < STREAM_IDLE_SECONDS:
+            return share
+        return min(STREAM_IDLE_CREDIT, share)
+
+    def rebalance() -> int:
+        """
+        Moves this stream's credit towards its target and returns the change:
+        positive for new credit, negative for unused credit taken back.
+        """
+        wanted = credit_target() - state["granted"] - state["in_flight"]
+        if wanted > 0:
+            credit = publish_budget.acquire(wanted, stream=True)
+        else:
+            credit = -min(-wanted, state["granted"])
+            publish_budget.release(-credit, stream=True)
+        state["granted"] += credit
+        return credit
+
+    async def send_acks():
+        """
+        Coalesces completions into cumulative ack frames. Returns the close
+        code and reason when a publish fails.
+        """
+        acked = 0
+        done = set()
+        failed = None
+        drain_deadline = None
+        while True:
+            try:
+                batch = [await asyncio.wait_for(completions.get(), STREAM_CREDIT_POLL)]
+            except asyncio.TimeoutError:
+                batch = []
+            while not completions.empty():
+                batch.append(completions.get_nowait())
+
+            for seq, error in batch:
+                if isinstance(error, Exception):
+                    failed = seq if failed is None else min(failed, seq)
+                else:
+                    done.add(seq)
+            state["in_flight"] -= len(batch)
+
+            previous = acked
+            while acked + 1 in done and (failed is None or acked + 1 < failed):
+                acked += 1
+                done.discard(acked)
+
+            if failed is not None:
+                if drain_deadline is None:
+                    # Records after the failure are resent by the client, so
+                    # stop publishing them.
+                    state["closing"] = True
+                    drain_deadline = loop.time() + STREAM_DRAIN_TIMEOUT
+                if acked != previous:
+                    await websocket.send_json({"type": "ack", "seq": acked, "credit": 0})
+                if acked + 1 < failed and loop.time() < drain_deadline:
+                    # Earlier records are still publishing
+                    continue
+                logger.error(f"Stream publish failed for tenant {tenant_id} at seq {failed}", extra={"correlation_id": "unknown"})
+                return status.WS_1011_INTERNAL_ERROR, f"Publish failed at seq {failed}"
+
+            credit = rebalance()
+            if acked != previous or credit:
+                await websocket.send_json({"type": "ack", "seq": acked, "credit": credit})
+
+    async def receive_records():
+        """
+        Publishes incoming records. Returns the close code and reason on a
+        protocol violation, or None when the client disconnects.
+        """
+        seq = 0
+        try:
+            while True:
+                frame = await websocket.receive_text()
+                seq += 1
+                state["last_record"] = loop.time()
+                if state["closing"]:
+                    continue
+
+                if state["granted"] > 0:
+                    state["granted"] -= 1
+                elif state["in_flight"] >= publish_budget.stream_share() or not publish_budget.acquire(1, stream=True):
+                    # A record sent before a credit reduction arrived is still
+                    # accepted while the stream is within its share.
+                    logger.error(f"Stream credit exceeded for tenant {tenant_id}", extra={"correlation_id": "unknown"})
+                    return status.WS_1008_POLICY_VIOLATION, "Credit exceeded"
+                state["in_flight"] += 1
+
+                try:
+                    record = StreamRecord(**json.loads(frame))
+                except Exception as e:
+                    publish_budget.release(stream=True)
+                    await websocket.send_json({"type": "error", "seq": seq, "detail": f"Invalid record: {str(e)}"})
+                    completions.put_nowait((seq, None))
+                    continue
+
+                normalized_data = build_envelope(tenant_id, record.log_id or str(uuid.uuid4()), record.text, "stream")
+                try:
+                    publish_envelope(normalized_data, on_done=completion_callback(seq), stream=True)
+                except Exception as e:
+                    # e.g. publisher flow control rejected the message
+                    completions.put_nowait((seq, e))
+        except WebSocketDisconnect:
+            return None
+        finally:
+            logger.info(f"Stream closed for tenant {tenant_id} after {seq} records", extra={"correlation_id": "unknown"})
+
+    publish_budget.streams += 1
+    ack_task = None
+    receive_task = None
+    try:
+        await websocket.send_json({"type": "ready", "tenant_id": tenant_id, "credit": rebalance()})
+        ack_task = asyncio.create_task(send_acks())
+        receive_task = asyncio.create_task(receive_records())
+        finished, _ = await asyncio.wait({ack_task, receive_task}, return_when=asyncio.FIRST_COMPLETED)
+
+        # Exactly one task decides how the connection ends; the other is
+        # cancelled so it never touches the socket again.
+        for task in (ack_task, receive_task):
+            if task not in finished:
+                task.cancel()
+
+        result = (receive_task if receive_task in finished else ack_task).result()
+        if result and websocket.application_state == WebSocketState.CONNECTED:
+            code, reason = result
+            await websocket.close(code=code, reason=reason)
+    except WebSocketDisconnect:
+        pass
+    except Exception as e:
+        logger.error(f"Internal error: {str(e)}", extra={"correlation_id": "unknown"})
+        if websocket.application_state == WebSocketState.CONNECTED:
+            await websocket.close(code=status.WS_1011_INTERNAL_ERROR, reason="Internal Server Error")
+    finally:
+        for task in (ack_task, receive_task):
+            if task is not None:
+                task.cancel()
+        publish_budget.streams -= 1
+        # Unused credit goes back to the pool; in-flight units are released
+        # by their publish callbacks.
+        publish_budget.release(state["granted"], stream=True)
+        state["granted"] = 0
+
+@app.get("/tenants/{tenant_id}/search")
+def search_logs(
+    tenant_id: str,
+    q: str,
+    limit: int = Query(50, ge=1, le=1000),
+    cursor: Optional[int] = Query(None, ge=0)
+):
+    """
+    Returns log_ids of the tenant's processed logs whose redacted text contains
+    every word in q, in ingestion order. Pass next_cursor back as cursor to
+    fetch the next page.
+    """
+    if not search_index:
+        logger.error("Search index not configured", extra={"correlation_id": "unknown"})
+        raise HTTPException(status_code=500, detail="Server misconfiguration")
+    if not q.strip():
+        raise HTTPException(status_code=400, detail="Query must not be empty")
+
+    try:
+        log_ids, next_cursor = search_index.search(tenant_id, q, limit, cursor)
+    except Exception as e:
+        logger.error(f"Search failed for tenant {tenant_id}: {str(e)}", extra={"correlation_id": "unknown"})
+        raise HTTPException(status_code=500, detail="Internal Server Error")
+
+    return {"tenant_id": tenant_id, "log_ids": log_ids, "next_cursor": next_cursor}
@@ -0,0 +1,841 @@
+import os
+import re
+import json
+import mmap
+import heapq
+import hashlib
+import struct
+import logging
+import threading
+from bisect import bisect_left
+from itertools import groupby
+from collections import defaultdict, OrderedDict
+from typing import Optional, Dict, List, Tuple, Iterable, Iterator
+from urllib.parse import quote
+
+logger = logging.getLogger(__name__)
+
+# Segment file layout (all integers little-endian):
+#   header:   magic, doc_count u32, term_count u32, docs_offset u64, terms_offset u64
+#   postings: per term, a skip table (block count, then last doc id delta and
+#             byte length << 1 | is_bitmap per block) followed by the blocks.
+#             A block is either varint delta-encoded doc ids or, when dense,
+#             a bitmap whose bit i is doc (previous block's last + 1 + i).
+#   docs:     (doc_count + 1) u64 offsets into a blob of utf-8 log_ids, then
+#             doc_count u32 doc ids sorted by log_id, then the blob
+#   terms:    (term_count + 1) fixed-size (term blob offset, postings offset,
+#             doc freq) entries sorted by term, then a blob of utf-8 terms
+#   bloom:    bloom filter over log_ids (BLOOM_BITS_PER_DOC bits per doc)
+# Both the log_id and term tables are binary-searched in place through the
+# mmap, so opening a segment only reads its header.
+MAGIC = b"RDPIDX3\0"
+HEADER = struct.Struct("<8sIIQQQQ")
+OFFSET = struct.Struct("<Q")
+DOC = struct.Struct("<I")
+TERM = struct.Struct("<QQQ")
+BLOCK_SIZE = 128
+# A block is stored as a bitmap when it spans at most this many doc ids per
+# doc, i.e. the bitmap is at most 4x the size of one-byte varint deltas.
+BITMAP_MAX_SPAN = 32
+BLOOM_BITS_PER_DOC = 10
+BLOOM_HASHES = 7
+
+TOKEN_RE = re.compile(r"\w+")
+
+MANIFEST = "manifest.json"
+WAL = "wal.jsonl"
+REFRESH_ATTEMPTS = 3
+
+class IndexEvicted(Exception):
+    """Raised by TenantIndex.add() after the index was evicted from its cache."""
+
+def tokenize(text: str) -> List[str]:
+    """Splits text into lowercase word tokens."""
+    return TOKEN_RE.findall(text.lower())
+
+def _encode_varint(value: int, out: bytearray):
+    while value >= 0x80:
+        out.append((value & 0x7F) | 0x80)
+        value >>= 7
+    out.append(value)
+
+def _decode_varint(buf, pos: int) -> Tuple[int, int]:
+    result = 0
+    shift = 0
+    while True:
+        byte = buf[pos]
+        pos += 1
+        result |= (byte & 0x7F) << shift
+        if byte < 0x80:
+            return result, pos
+        shift += 7
+
+def _bloom_hash(log_id: str) -> Tuple[int, int]:
+    digest = hashlib.blake2b(log_id.encode("utf-8"), digest_size=16).digest()
+    return int.from_bytes(digest[:8], "little"), int.from_bytes(digest[8:], "little") | 1
+
+def _bloom_positions(hashed: Tuple[int, int], bits: int) -> Iterator[int]:
+    h1, h2 = hashed
+    for i in range(BLOOM_HASHES):
+        yield (h1 + i * h2) % bits
+
+def _encode_postings(docs: List[int]) -> bytearray:
+    """Encodes sorted doc ids as a skip table followed by delta-encoded blocks."""
+    skips = bytearray()
+    blocks = bytearray()
+    prev = -1
+    block_count = 0
+    for start in range(0, len(docs), BLOCK_SIZE):
+        chunk = docs[start:start + BLOCK_SIZE]
+        span = chunk[-1] - prev
+        is_bitmap = span <= BITMAP_MAX_SPAN * len(chunk)
+        if is_bitmap:
+            bits = 0
+            for doc in chunk:
+                bits |= 1 << (doc - prev - 1)
+            block = bits.to_bytes((span + 7) // 8, "little")
+        else:
+            block = bytearray()
+            block_prev = prev
+            for doc in chunk:
+                _encode_varint(doc - block_prev, block)
+                block_prev = doc
+        _encode_varint(span, skips)
+        _encode_varint(len(block) << 1 | is_bitmap, skips)
+        blocks += block
+        prev = chunk[-1]
+        block_count += 1
+
+    out = bytearray()
+    _encode_varint(block_count, out)
+    return out + skips + blocks
+
+def write_segment(path: str, log_ids: List[str], postings: Iterable[Tuple[str, List[int]]]):
+    """
+    Writes an immutable segment file.
+    postings must yield (term, sorted doc ids) in sorted term order.
+    """
+    tmp_path = path + ".tmp"
+    entries = []
+    with open(tmp_path, "wb") as f:
+        f.write(b"\0" * HEADER.size)
+        offset = HEADER.size
+        for term, docs in postings:
+            encoded = _encode_postings(docs)
+            f.write(encoded)
+            entries.append((term.encode("utf-8"), offset, len(docs)))
+            offset += len(encoded)
+
+        docs_offset = offset
+        encoded_ids = [log_id.encode("utf-8") for log_id in log_ids]
+        table = bytearray()
+        blob_size = 0
+        for log_id in encoded_ids:
+            table += OFFSET.pack(blob_size)
+            blob_size += len(log_id)
+        table += OFFSET.pack(blob_size)
+        for doc in sorted(range(len(encoded_ids)), key=encoded_ids.__getitem__):
+            table += DOC.pack(doc)
+        f.write(table)
+        f.write(b"".join(encoded_ids))
+
+        terms_offset = docs_offset + len(table) + blob_size
+        table = bytearray()
+        blob_size = 0
+        for term, postings_offset, df in entries:
+            table += TERM.pack(blob_size, postings_offset, df)
+            blob_size += len(term)
+        table += TERM.pack(blob_size, 0, 0)
+        f.write(table)
+        f.write(b"".join(term for term, _, _ in entries))
+
+        bloom_offset = terms_offset + len(table) + blob_size
+        bloom_bits = max(len(log_ids) * BLOOM_BITS_PER_DOC, 8)
+        bloom = bytearray((bloom_bits + 7) // 8)
+        for log_id in log_ids:
+            for pos in _bloom_positions(_bloom_hash(log_id), bloom_bits):
+                bloom[pos >> 3] |= 1 << (pos & 7)
+        f.write(bloom)
+
+        f.seek(0)
+        f.write(HEADER.pack(MAGIC, len(log_ids), len(entries), docs_offset, terms_offset, bloom_offset, bloom_bits))
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+class _PostingsCursor:
+    """
+    Forward-only cursor over one term's postings. Blocks are located through
+    the skip table and only decoded (or, for bitmaps, read) when needed.
+    """
+
+    def __init__(self, buf, lasts: List[int], offsets: List[int], bitmaps: List[bool], df: int):
+        self.buf = buf
+        self.lasts = lasts
+        self.offsets = offsets
+        self.bitmaps = bitmaps
+        self.df = df
+        self._next = 0
+        self._block = -1
+        self._bits = 0
+        self._docs: List[int] = []
+
+    def base(self, block: int) -> int:
+        """Smallest doc id the block may hold."""
+        return self.lasts[block - 1] + 1 if block > 0 else 0
+
+    def find_block(self, doc: int) -> int:
+        """Returns the first block whose last doc id is >= doc, moving forward."""
+        self._next = bisect_left(self.lasts, doc, self._next)
+        return self._next
+
+    def _load(self, block: int):
+        if block == self._block:
+            return
+        pos = self.offsets[block]
+        end = self.offsets[block + 1]
+        if self.bitmaps[block]:
+            self._bits = int.from_bytes(self.buf[pos:end], "little")
+            self._docs = []
+        else:
+            doc = self.base(block) - 1
+            docs = []
+            while pos < end:
+                delta, pos = _decode_varint(self.buf, pos)
+                doc += delta
+                docs.append(doc)
+            self._docs = docs
+        self._block = block
+
+    def block_docs(self, block: int) -> List[int]:
+        self._load(block)
+        if not self.bitmaps[block]:
+            return self._docs
+        base = self.base(block)
+        return [base + i for i, bit in enumerate(bin(self._bits)[:1:-1]) if bit == "1"]
+
+    def contains(self, doc: int) -> Optional[bool]:
+        """Whether doc is in the postings, or None if they end before it."""
+        block = self.find_block(doc)
+        if block == len(self.lasts):
+            return None
+        base = self.base(block)
+        if doc < base:
+            return False
+        self._load(block)
+        if self.bitmaps[block]:
+            return bool(self._bits >> (doc - base) & 1)
+        i = bisect_left(self._docs, doc)
+        return i < len(self._docs) and self._docs[i] == doc
+
+    def bits(self, lo: int, hi: int) -> int:
+        """Returns the docs in [lo, hi] as a bitmap whose bit i is doc lo + i."""
+        out = 0
+        block = self.find_block(lo)
+        while block < len(self.lasts):
+            base = self.base(block)
+            if base > hi:
+                break
+            self._load(block)
+            if self.bitmaps[block]:
+                bits = self._bits
+            else:
+                bits = 0
+                for doc in self._docs:
+                    bits |= 1 << (doc - base)
+            out |= bits << (base - lo) if base >= lo else bits >> (lo - base)
+            block += 1
+        return out & ((1 << (hi - lo + 1)) - 1)
+
+    def docs(self) -> List[int]:
+        """Decodes every doc id (used by merges)."""
+        out = []
+        for block in range(len(self.lasts)):
+            out.extend(self.block_docs(block))
+        return out
+
+class Segment:
+    """A memory-mapped, immutable segment file."""
+
+    SKIP_CACHE_SIZE = 4096
+
+    def __init__(self, path: str):
+        self.path = path
+        self.name = os.path.basename(path)
+        with open(path, "rb") as f:
+            self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, self.doc_count, self.term_count, docs_offset, terms_offset, self._bloom_offset, self._bloom_bits = HEADER.unpack_from(self._mm, 0)
+        if magic != MAGIC:
+            raise ValueError(f"Not a segment file: {path}")
+
+        self._docs_offset = docs_offset
+        self._sorted_offset = docs_offset + (self.doc_count + 1) * OFFSET.size
+        self._blob_offset = self._sorted_offset + self.doc_count * DOC.size
+        self._terms_offset = terms_offset
+        self._term_blob_offset = terms_offset + (self.term_count + 1) * TERM.size
+        self._skips: Dict[str, Tuple[List[int], List[int], List[bool], int]] = {}
+
+    def _term(self, i: int) -> bytes:
+        start, _, _ = TERM.unpack_from(self._mm, self._terms_offset + i * TERM.size)
+        end, _, _ = TERM.unpack_from(self._mm, self._terms_offset + (i + 1) * TERM.size)
+        return self._mm[self._term_blob_offset + start:self._term_blob_offset + end]
+
+    def _find_term(self, term: str) -> Optional[Tuple[int, int]]:
+        """Binary-searches the term table; returns (postings offset, doc freq)."""
+        key = term.encode("utf-8")
+        lo, hi = 0, self.term_count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self._term(mid) < key:
+                lo = mid + 1
+            else:
+                hi = mid
+        if lo == self.term_count or self._term(lo) != key:
+            return None
+        _, offset, df = TERM.unpack_from(self._mm, self._terms_offset + lo * TERM.size)
+        return offset, df
+
+    def terms(self) -> Iterator[Tuple[str, Tuple[int, int]]]:
+        """Yields (term, (postings offset, doc freq)) in sorted term order."""
+        for i in range(self.term_count):
+            _, offset, df = TERM.unpack_from(self._mm, self._terms_offset + i * TERM.size)
+            yield self._term(i).decode("utf-8"), (offset, df)
+
+    def postings(self, term: str, entry: Optional[Tuple[int, int]] = None) -> Optional[_PostingsCursor]:
+        """
+        Returns a cursor over term's postings, or None if the term is absent.
+        entry, as yielded by terms(), skips the dictionary lookup.
+        """
+        skips = self._skips.get(term)
+        if skips is None:
+            if entry is None:
+                entry = self._find_term(term)
+            if entry is None:
+                return None
+            offset, df = entry
+            block_count, pos = _decode_varint(self._mm, offset)
+            lasts = []
+            lengths = []
+            bitmaps = []
+            last = -1
+            for _ in range(block_count):
+                delta, pos = _decode_varint(self._mm, pos)
+                length, pos = _decode_varint(self._mm, pos)
+                last += delta
+                lasts.append(last)
+                lengths.append(length >> 1)
+                bitmaps.append(bool(length & 1))
+            offsets = [pos]
+            for length in lengths:
+                offsets.append(offsets[-1] + length)
+            skips = (lasts, offsets, bitmaps, df)
+            if len(self._skips) >= self.SKIP_CACHE_SIZE:
+                self._skips.clear()
+            self._skips[term] = skips
+
+        return _PostingsCursor(self._mm, *skips)
+
+    def _log_id(self, doc: int) -> bytes:
+        pos = self._docs_offset + doc * OFFSET.size
+        start, = OFFSET.unpack_from(self._mm, pos)
+        end, = OFFSET.unpack_from(self._mm, pos + OFFSET.size)
+        return self._mm[self._blob_offset + start:self._blob_offset + end]
+
+    def log_id(self, doc: int) -> str:
+        return self._log_id(doc).decode("utf-8")
+
+    def log_ids(self) -> List[str]:
+        return [self.log_id(doc) for doc in range(self.doc_count)]
+
+    def contains(self, log_id: str, hashed: Optional[Tuple[int, int]] = None) -> bool:
+        """
+        Checks the bloom filter, then binary-searches the log_id table.
+        hashed is _bloom_hash(log_id), for callers probing several segments.
+        """
+        for pos in _bloom_positions(hashed or _bloom_hash(log_id), self._bloom_bits):
+            if not self._mm[self._bloom_offset + (pos >> 3)] & (1 << (pos & 7)):
+                return False
+
+        key = log_id.encode("utf-8")
+        lo, hi = 0, self.doc_count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            doc, = DOC.unpack_from(self._mm, self._sorted_offset + mid * DOC.size)
+            if self._log_id(doc) < key:
+                lo = mid + 1
+            else:
+                hi = mid
+        if lo == self.doc_count:
+            return False
+        doc, = DOC.unpack_from(self._mm, self._sorted_offset + lo * DOC.size)
+        return self._log_id(doc) == key
+
+    def close(self):
+        self._mm.close()
+
+def _match(cursors: List[_PostingsCursor], start: int) -> Iterator[int]:
+    """
+    Yields doc ids >= start present in every cursor, a block of the rarest
+    term at a time. A block is skipped without being read when another term
+    has no docs in its range. Bitmap blocks are intersected as whole ints;
+    the docs of a delta-encoded block are probed one by one.
+    """
+    cursors = sorted(cursors, key=lambda c: c.df)
+    lead, rest = cursors[0], cursors[1:]
+    for block in range(lead.find_block(start), len(lead.lasts)):
+        lo = max(lead.base(block), start)
+        hi = lead.lasts[block]
+        skip = False
+        for cursor in rest:
+            other = cursor.find_block(lo)
+            if other == len(cursor.lasts):
+                return
+            if cursor.base(other) > hi:
+                skip = True
+                break
+        if skip:
+            continue
+
+        if lead.bitmaps[block]:
+            mask = lead.bits(lo, hi)
+            for cursor in rest:
+                if not mask:
+                    break
+                mask &= cursor.bits(lo, hi)
+            while mask:
+                low = mask & -mask
+                yield lo + low.bit_length() - 1
+                mask ^= low
+        else:
+            for doc in lead.block_docs(block):
+                if doc < lo:
+                    continue
+                for cursor in rest:
+                    found = cursor.contains(doc)
+                    if found is None:
+                        return
+                    if not found:
+                        break
+                else:
+                    yield doc
+
+def _pick_merge(counts: List[int], merge_factor: int) -> Optional[Tuple[int, int]]:
+    """
+    Picks adjacent segments [start, end) to merge, or None.
+
+    Only segments of similar size are merged: a window qualifies if no segment
+    in it holds more than half of its docs. Every merge therefore at least
+    doubles the segment a doc lives in, so each doc is rewritten at most
+    log2(N) times. Longer windows are preferred, then the smallest one.
+    """
+    if len(counts) < merge_factor:
+        return None
+    for length in range(merge_factor, 1, -1):
+        best = None
+        for start in range(len(counts) - length + 1):
+            window = counts[start:start + length]
+            total = sum(window)
+            if max(window) * 2 <= total and (best is None or total < best[0]):
+                best = (total, start)
+        if best is not None:
+            return best[1], best[1] + length
+    return None
+
+class TenantIndex:
+    """
+    Inverted index for a single tenant.
+
+    Records are appended to a write-ahead log and buffered in memory, then
+    flushed into immutable segments. Adjacent segments are merged in the
+    background, so a doc's position (its ordinal across all segments) never
+    changes and can be used as a pagination cursor.
+
+    Only one process may write to a tenant index; any number may search it.
+    """
+
+    def __init__(self, path: str, flush_docs: int = 10000, merge_factor: int = 8):
+        self.path = path
+        self.flush_docs = flush_docs
+        self.merge_factor = merge_factor
+        self.evicted = False
+        # Total docs rewritten by merges
+        self.docs_merged = 0
+        self._lock = threading.RLock()
+        self._merge_lock = threading.Lock()
+        self._refresh_lock = threading.Lock()
+        # Replaced rather than mutated, so searches read it without locking.
+        self._segments: List[Segment] = []
+        self._generation = 0
+        self._manifest_stat = None
+        self._wal = None
+        self._buffer_log_ids: List[str] = []
+        self._buffer_ids = set()
+        self._buffer_postings: Dict[str, List[int]] = defaultdict(list)
+
+    @property
+    def writable(self) -> bool:
+        return self._wal is not None
+
+    def _manifest_path(self) -> str:
+        return os.path.join(self.path, MANIFEST)
+
+    def _stat_manifest(self) -> Optional[Tuple[int, int, int]]:
+        try:
+            st = os.stat(self._manifest_path())
+        except FileNotFoundError:
+            return None
+        return st.st_ino, st.st_mtime_ns, st.st_size
+
+    def _refresh(self):
+        """
+        Reloads the segment list if another process updated the manifest.
+        If another thread is already reloading, this returns at once and
+        searches keep using the current list.
+
+        Raises FileNotFoundError if the manifest lists a segment that does not
+        exist, rather than serving the other segments: cursors are doc
+        ordinals across all segments, so dropping one would shift them.
+        """
+        if not self._refresh_lock.acquire(blocking=False):
+            return
+        try:
+            for attempt in range(REFRESH_ATTEMPTS):
+                stat_key = self._stat_manifest()
+                if stat_key is None or stat_key == self._manifest_stat:
+                    return
+                with open(self._manifest_path(), "r") as f:
+                    manifest = json.load(f)
+
+                # Segments dropped by a merge are not closed here, since a
+                # concurrent search may still be reading them; their maps are
+                # released on GC.
+                current = {seg.name: seg for seg in self._segments}
+                segments = []
+                missing = []
+                for name in manifest["segments"]:
+                    try:
+                        segments.append(current.get(name) or Segment(os.path.join(self.path, name)))
+                    except FileNotFoundError:
+                        missing.append(name)
+
+                if missing and self._stat_manifest() != stat_key and attempt < REFRESH_ATTEMPTS - 1:
+                    # A merge replaced the manifest after we read it; retry with the new one.
+                    continue
+                if missing:
+                    logger.error(f"Index {self.path} is missing segments {missing}", extra={"correlation_id": "unknown"})
+                    raise FileNotFoundError(f"Index {self.path} is missing segments {missing}")
+                self._segments = segments
+                self._generation = manifest["generation"]
+                self._manifest_stat = stat_key
+                return
+        finally:
+            self._refresh_lock.release()
+
+    def _write_manifest(self):
+        tmp_path = self._manifest_path() + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump({"generation": self._generation, "segments": [seg.name for seg in self._segments]}, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self._manifest_path())
+        self._manifest_stat = self._stat_manifest()
+
+    def _open_writer(self):
+        """Loads segments and replays unflushed records from the WAL."""
+        if self._wal is not None:
+            return
+        os.makedirs(self.path, exist_ok=True)
+        self._refresh()
+        wal_path = os.path.join(self.path, WAL)
+        if os.path.exists(wal_path):
+            with open(wal_path, "r", encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        # Torn write from a crash; the record was never acked.
+                        continue
+                    # Records flushed just before a crash are already in a segment.
+                    if not self._contains(record["log_id"]):
+                        self._buffer(record["log_id"], record["text"])
+        self._wal = open(wal_path, "a", encoding="utf-8")
+
+    def _contains(self, log_id: str) -> bool:
+        if log_id in self._buffer_ids:
+            return True
+        hashed = _bloom_hash(log_id)
+        return any(seg.contains(log_id, hashed) for seg in self._segments)
+
+    def _buffer(self, log_id: str, text: str):
+        doc = len(self._buffer_log_ids)
+        self._buffer_log_ids.append(log_id)
+        self._buffer_ids.add(log_id)
+        for token in set(tokenize(text)):
+            self._buffer_postings[token].append(doc)
+
+    def add(self, log_id: str, text: str) -> bool:
+        """
+        Indexes one record. It becomes searchable after the next flush.
+        Returns False if log_id is already indexed, e.g. on Pub/Sub redelivery.
+        """
+        with self._lock:
+            if self.evicted:
+                raise IndexEvicted(self.path)
+            self._open_writer()
+            if self._contains(log_id):
+                return False
+            self._wal.write(json.dumps({"log_id": log_id, "text": text}) + "\n")
+            self._wal.flush()
+            self._buffer(log_id, text)
+            if len(self._buffer_log_ids) >= self.flush_docs:
+                self.flush()
+            return True
+
+    def flush(self):
+        """Writes buffered records to a new segment and clears the WAL."""
+        with self._lock:
+            if not self._buffer_log_ids:
+                return
+            self._generation += 1
+            name = f"seg_{self._generation:08d}.idx"
+            write_segment(
+                os.path.join(self.path, name),
+                self._buffer_log_ids,
+                sorted(self._buffer_postings.items()),
+            )
+            self._segments = self._segments + [Segment(os.path.join(self.path, name))]
+            self._write_manifest()
+
+            self._buffer_log_ids = []
+            self._buffer_ids = set()
+            self._buffer_postings = defaultdict(list)
+            self._wal.close()
+            self._wal = open(os.path.join(self.path, WAL), "w", encoding="utf-8")
+
+    def merge(self) -> bool:
+        """
+        Merges one run of similarly sized adjacent segments (see _pick_merge).
+        Returns True if a merge happened. Searches and adds are not blocked
+        while the merged segment is written.
+        """
+        with self._merge_lock:
+            with self._lock:
+                if self._wal is None:
+                    return False
+                segments = self._segments
+                picked = _pick_merge([seg.doc_count for seg in segments], self.merge_factor)
+                if picked is None:
+                    return False
+                window = segments[picked[0]:picked[1]]
+                self._generation += 1
+                name = f"seg_{self._generation:08d}.idx"
+
+            bases = []
+            log_ids: List[str] = []
+            for seg in window:
+                bases.append(len(log_ids))
+                log_ids.extend(seg.log_ids())
+
+            def merged_postings():
+                # Walks every segment's term table in order; ties on a term
+                # sort by segment index, so postings come out in segment order.
+                def tagged(i):
+                    for term, entry in window[i].terms():
+                        yield term, i, entry
+
+                streams = [tagged(i) for i in range(len(window))]
+                for term, group in groupby(heapq.merge(*streams), key=lambda item: item[0]):
+                    docs = []
+                    for _, i, entry in group:
+                        docs.extend(bases[i] + doc for doc in window[i].postings(term, entry).docs())
+                    yield term, docs
+
+            write_segment(os.path.join(self.path, name), log_ids, merged_postings())
+            merged = Segment(os.path.join(self.path, name))
+
+            with self._lock:
+                # Flushes only append, so the window is still contiguous.
+                start = self._segments.index(window[0])
+                self._segments = self._segments[:start] + [merged] + self._segments[start + len(window):]
+                self._write_manifest()
+                self.docs_merged += len(log_ids)
+
+            for seg in window:
+                os.remove(seg.path)
+            logger.info(f"Merged {len(window)} segments into {name} ({len(log_ids)} docs)", extra={"correlation_id": "unknown"})
+            return True
+
+    def search(self, q: str, limit: int = 50, cursor: Optional[int] = None) -> Tuple[List[str], Optional[int]]:
+        """
+        Returns up to limit distinct log_ids of records containing every token
+        in q, in ingestion order, and the cursor for the next page (None on
+        the last page). Raises FileNotFoundError if a segment is missing (see
+        _refresh).
+        """
+        tokens = list(set(tokenize(q)))
+        if not tokens:
+            return [], None
+
+        if self._wal is None:
+            self._refresh()
+        segments = self._segments
+
+        start = cursor + 1 if cursor is not None else 0
+        matches: List[Tuple[int, str]] = []
+        seen = set()
+        base = 0
+        for seg in segments:
+            if len(matches) > limit:
+                break
+            if base + seg.doc_count > start:
+                cursors = [seg.postings(token) for token in tokens]
+                if all(cursors):
+                    for doc in _match(cursors, max(start - base, 0)):
+                        log_id = seg.log_id(doc)
+                        # add() skips indexed log_ids; this only keeps pages
+                        # full should a duplicate still reach the index.
+                        if log_id in seen:
+                            continue
+                        seen.add(log_id)
+                        matches.append((base + doc, log_id))
+                        if len(matches) > limit:
+                            break
+            base += seg.doc_count
+
+        page = matches[:limit]
+        next_cursor = page[-1][0] if len(matches) > limit else None
+        return [log_id for _, log_id in page], next_cursor
+
+    def evict(self) -> bool:
+        """
+        Flushes and closes the writer and drops the segment list, so a cache
+        can let go of this index. Returns False, leaving the index open, while
+        a merge is running. Segments are released on GC once searches still
+        reading them finish.
+        """
+        if not self._merge_lock.acquire(blocking=False):
+            return False
+        try:
+            with self._lock:
+                if self._wal is not None:
+                    self.flush()
+                    self._wal.close()
+                    self._wal = None
+                self.evicted = True
+                self._segments = []
+                self._manifest_stat = None
+            return True
+        finally:
+            self._merge_lock.release()
+
+    def close(self):
+        with self._lock:
+            if self._wal is not None:
+                self._wal.close()
+                self._wal = None
+            for seg in self._segments:
+                seg.close()
+            self._segments = []
+            self._manifest_stat = None
+
+class SearchIndex:
+    """
+    Tenant-partitioned inverted index rooted at a directory, with one
+    TenantIndex per tenant under `root/t_<tenant_id>`.
+
+    At most max_tenants tenant indexes are kept open. The least recently
+    used are evicted: writers flush and close their WAL, and are reopened by
+    the next add().
+    """
+
+    def __init__(self, root: str, flush_docs: int = 10000, merge_factor: int = 8, max_tenants: int = 1024):
+        self.root = root
+        self.flush_docs = flush_docs
+        self.merge_factor = merge_factor
+        self.max_tenants = max_tenants
+        self._tenants: "OrderedDict[str, TenantIndex]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def _tenant(self, tenant_id: str, create: bool) -> Optional[TenantIndex]:
+        with self._lock:
+            index = self._tenants.get(tenant_id)
+            if index is not None:
+                self._tenants.move_to_end(tenant_id)
+            else:
+                path = os.path.join(self.root, "t_" + quote(tenant_id, safe=""))
+                if not create and not os.path.isdir(path):
+                    return None
+                index = TenantIndex(path, self.flush_docs, self.merge_factor)
+                self._tenants[tenant_id] = index
+
+            excess = len(self._tenants) - self.max_tenants
+            # Evicted under the lock, so a tenant never has two open writers.
+            # Indexes busy merging are skipped and evicted on a later call.
+            for t, cached in list(self._tenants.items()):
+                if excess <= 0:
+                    break
+                if t != tenant_id and cached.evict():
+                    del self._tenants[t]
+                    excess -= 1
+            return index
+
+    def tenant(self, tenant_id: str) -> TenantIndex:
+        """
+        Returns the tenant's index for writing, creating it if needed. If it
+        is evicted before add() is called, add() raises IndexEvicted.
+        """
+        return self._tenant(tenant_id, create=True)
+
+    def add(self, tenant_id: str, log_id: str, text: str) -> bool:
+        while True:
+            try:
+                return self.tenant(tenant_id).add(log_id, text)
+            except IndexEvicted:
+                # Evicted between the lookup and the add; reopen it.
+                continue
+
+    def search(self, tenant_id: str, q: str, limit: int = 50, cursor: Optional[int] = None) -> Tuple[List[str], Optional[int]]:
+        index = self._tenant(tenant_id, create=False)
+        if index is None:
+            return [], None
+        return index.search(q, limit, cursor)
+
+    def flush(self):
+        with self._lock:
+            tenants = list(self._tenants.values())
+        for index in tenants:
+            index.flush()
+
+    def merge(self):
+        with self._lock:
+            tenants = list(self._tenants.values())
+        for index in tenants:
+            while index.merge():
+                pass
+
+    def start_background(self, interval: float = 5.0):
+        """Flushes and merges every `interval` seconds on a daemon thread."""
+        def run():
+            while not self._stop.wait(interval):
+                try:
+                    self.flush()
+                    self.merge()
+                except Exception as e:
+                    logger.error(f"Background index maintenance failed: {e}", extra={"correlation_id": "unknown"})
+
+        self._stop.clear()
+        self._thread = threading.Thread(target=run, name="search-index", daemon=True)
+        self._thread.start()
+
+    def close(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        self.flush()
+        with self._lock:
+            for index in self._tenants.values():
+                index.close()
+            self._tenants.clear()
@@ -5,6 +5,7 @@ import random
 import uuid
 import sys
 import argparse
+import json
 from concurrent.futures import ThreadPoolExecutor
 
 def send_request(api_url, tenant_id):
@@ -36,7 +37,13 @@ def send_request(api_url, tenant_id):
 def run_stress_test(api_url, rpm, duration_sec):
     print(f"Starting stress test against {api_url}")
     print(f"Target: {rpm} RPM for {duration_sec} seconds")
-    
+    results = run_http(api_url, rpm, duration_sec)
+    failures = report("HTTP", results)
+    if failures > 0:
+        sys.exit(1)
+
+def run_http(api_url, rpm, duration_sec):
+    """Sends one POST /ingest per record. Returns (status, latency) pairs."""
     delay = 60.0 / rpm
     total_requests = int((rpm / 60.0) * duration_sec)
     
@@ -58,18 +65,121 @@ def run_stress_test(api_url, rpm, duration_sec):
                 
         for f in futures:
             results.append(f.result())
-            
-    # Analyze
+
+    return results
+
+def stream_tenant(ws_url, tenant_id, rate, total_records):
+    """
+    Streams records for one tenant over a single /ingest/stream connection,
+    paced at `rate` records per second and respecting server credit.
+    Returns (status, latency) pairs, where latency runs from send to cumulative ack.
+    """
+    from websockets.sync.client import connect
+
+    sent_at = {}
+    results = []
+    credit = threading.Semaphore(0)
+    acked = [0]
+
+    with connect(f"{ws_url}/ingest/stream", additional_headers={"X-Tenant-ID": tenant_id}) as ws:
+        ready = json.loads(ws.recv())
+        for _ in range(ready["credit"]):
+            credit.release()
+
+        def read_acks():
+            try:
+                while acked[0] < total_records:
+                    frame = json.loads(ws.recv())
+                    if frame["type"] == "error":
+                        results.append((400, time.time() - sent_at.pop(frame["seq"])))
+                    elif frame["type"] == "ack":
+                        now = time.time()
+                        for seq in range(acked[0] + 1, frame["seq"] + 1):
+                            if seq in sent_at:
+                                results.append((202, now - sent_at.pop(seq)))
+                        acked[0] = frame["seq"]
+                        for _ in range(frame["credit"]):
+                            credit.release()
+                        # Negative credit takes back permits not yet used
+                        for _ in range(-frame["credit"]):
+                            credit.acquire(blocking=False)
+            except Exception:
+                pass
+
+        reader = threading.Thread(target=read_acks)
+        reader.start()
+
+        delay = 1.0 / rate
+        start_time = time.time()
+        for i in range(total_records):
+            if not credit.acquire(timeout=30):
+                break
+            log_id = str(uuid.uuid4())
+            text = f"Stress test message {log_id} with sensitive info 555-0199 " * random.randint(1, 5)
+            sent_at[i + 1] = time.time()
+            ws.send(json.dumps({"log_id": log_id, "text": text}))
+
+            # Simple pacing
+            time_elapsed = time.time() - start_time
+            expected_time = (i + 1) * delay
+            if expected_time > time_elapsed:
+                time.sleep(expected_time - time_elapsed)
+
+        reader.join(timeout=30)
+
+    # Anything never acked counts as a failure
+    results.extend((0, 0) for _ in range(total_records - len(results)))
+    return results
+
+def run_stream(api_url, rpm, duration_sec, tenants=5):
+    """Streams the same record rate as run_http over one connection per tenant."""
+    ws_url = api_url.replace("https://", "wss://").replace("http://", "ws://")
+    total_requests = int((rpm / 60.0) * duration_sec)
+    # Spread the remainder so both modes send exactly total_requests records
+    counts = [total_requests // tenants + (1 if i < total_requests % tenants else 0) for i in range(tenants)]
+
+    with ThreadPoolExecutor(max_workers=tenants) as executor:
+        futures = [
+            executor.submit(stream_tenant, ws_url, f"tenant-{i + 1}", (rpm / 60.0) * count / total_requests, count)
+            for i, count in enumerate(counts)
+            if count > 0
+        ]
+        results = []
+        for f in futures:
+            results.extend(f.result())
+
+    return results
+
+def report(label, results, elapsed=None):
+    """Prints a summary and returns the failure count."""
     success = len([r for r in results if r[0] == 202])
     failures = len([r for r in results if r[0] != 202])
-    avg_time = sum([r[1] for r in results]) / len(results) if results else 0
-    
-    print("\n--- Results ---")
+    latencies = sorted([r[1] for r in results if r[0] == 202])
+    avg_time = sum(latencies) / len(latencies) if latencies else 0
+    p99 = latencies[int(len(latencies) * 0.99) - 1] if latencies else 0
+
+    print(f"\n--- {label} Results ---")
     print(f"Total Requests: {len(results)}")
     print(f"Success: {success}")
     print(f"Failures: {failures}")
     print(f"Avg Response Time: {avg_time:.4f}s")
-    
+    print(f"P99 Response Time: {p99:.4f}s")
+    if elapsed:
+        print(f"Achieved Rate: {len(results) / elapsed * 60:.0f} RPM")
+
+    return failures
+
+def run_comparison(api_url, rpm, duration_sec):
+    """Runs per-record HTTP and streaming ingest back to back at equal record rates."""
+    print(f"Comparing HTTP and streaming ingest against {api_url}")
+    print(f"Target: {rpm} RPM for {duration_sec} seconds each")
+
+    failures = 0
+    for label, runner in (("HTTP", run_http), ("Stream", run_stream)):
+        start = time.time()
+        results = runner(api_url, rpm, duration_sec)
+        failures += report(label, results, time.time() - start)
+
     if failures > 0:
         sys.exit(1)
 
@@ -78,6 +188,15 @@ if __name__ == "__main__":
     parser.add_argument("url", help="API URL")
     parser.add_argument("--rpm", type=int, default=1000, help="Requests per minute")
     parser.add_argument("--duration", type=int, default=60, help="Duration in seconds")
+    parser.add_argument("--mode", choices=["http", "stream", "compare"], default="http",
+                        help="http: POST /ingest per record, stream: /ingest/stream WebSocket, compare: both")
     
     args = parser.parse_args()
-    run_stress_test(args.url, args.rpm, args.duration)
+    if args.mode == "compare":
+        run_comparison(args.url, args.rpm, args.duration)
+    elif args.mode == "stream":
+        start = time.time()
+        if report("Stream", run_stream(args.url, args.rpm, args.duration), time.time() - start) > 0:
+            sys.exit(1)
+    else:
+        run_stress_test(args.url, args.rpm, args.duration)
@@ -2,6 +2,9 @@ import pytest
 from unittest.mock import MagicMock, patch
 import sys
 import os
+import json
+import time
+from concurrent.futures import Future
 
 # Mock google.cloud.pubsub_v1 before importing main
 sys.modules["google.cloud"] = MagicMock()
@@ -10,8 +13,9 @@ sys.modules["google.cloud.pubsub_v1"] = MagicMock()
 # Add api directory to path
 sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'api'))
 
+from fastapi import WebSocketDisconnect
 from fastapi.testclient import TestClient
-from main import app
+from main import app, PublishBudget
 
 client = TestClient(app)
 
@@ -57,3 +61,206 @@ def test_ingest_text_missing_header(mock_publisher):
     response = client.post("/ingest", content="raw text log", headers=headers)
     assert response.status_code == 400
     mock_publisher.publish.assert_not_called()
+
+@pytest.fixture
+def publish_budget():
+    budget = PublishBudget(1000)
+    with patch("main.publish_budget", budget), patch("main.topic_path", "projects/test/topics/test"):
+        yield budget
+
+@pytest.fixture
+def stream_publisher(mock_publisher, publish_budget):
+    # Complete every publish immediately so acks are sent
+    mock_publisher.publish.return_value.add_done_callback.side_effect = lambda cb: cb(MagicMock())
+    yield mock_publisher
+
+@pytest.fixture
+def pending_publishes(mock_publisher, publish_budget):
+    # Publishes complete only when the test resolves their futures
+    futures = []
+    def publish(*args, **kwargs):
+        futures.append(Future())
+        return futures[-1]
+    mock_publisher.publish.side_effect = publish
+    yield futures
+
+def wait_for_publishes(futures, count):
+    deadline = time.time() + 5
+    while len(futures) < count and time.time() < deadline:
+        time.sleep(0.01)
+    assert len(futures) == count
+
+def receive_ack(ws, seq):
+    """Reads acks until seq is acked and returns the credit they granted."""
+    credit = 0
+    acked = -1
+    while acked < seq:
+        ack = ws.receive_json()
+        assert ack["type"] == "ack"
+        acked = ack["seq"]
+        credit += ack["credit"]
+    return credit
+
+def test_ingest_stream_acks_records(stream_publisher):
+    with client.websocket_connect("/ingest/stream", headers={"X-Tenant-ID": "test-tenant"}) as ws:
+        ready = ws.receive_json()
+        assert ready["type"] == "ready"
+        assert ready["tenant_id"] == "test-tenant"
+        ws.send_text('{"log_id": "log-1", "text": "first"}')
+        ws.send_text('{"text": "second"}')
+        acked = 0
+        while acked < 2:
+            ack = ws.receive_json()
+            assert ack["type"] == "ack"
+            acked = ack["seq"]
+    assert stream_publisher.publish.call_count == 2
+    envelope = json.loads(stream_publisher.publish.call_args_list[0][0][1])
+    assert envelope == {"tenant_id": "test-tenant", "log_id": "log-1", "text": "first", "source": "stream"}
+
+def test_ingest_stream_tenant_frame(stream_publisher):
+    with client.websocket_connect("/ingest/stream") as ws:
+        ws.send_text('{"tenant_id": "frame-tenant"}')
+        assert ws.receive_json()["tenant_id"] == "frame-tenant"
+        ws.send_text('{"text": "hello"}')
+        assert receive_ack(ws, 1) > 0
+    envelope = json.loads(stream_publisher.publish.call_args[0][1])
+    assert envelope["tenant_id"] == "frame-tenant"
+
+def test_ingest_stream_invalid_record(stream_publisher):
+    with client.websocket_connect("/ingest/stream", headers={"X-Tenant-ID": "test-tenant"}) as ws:
+        ws.receive_json()
+        ws.send_text('{"log_id": "no-text"}')
+        assert ws.receive_json()["type"] == "error"
+        assert receive_ack(ws, 1) > 0
+    stream_publisher.publish.assert_not_called()
+
+def test_ingest_stream_credit_exceeded(mock_publisher, publish_budget):
+    # Publishes never complete, so no credit is returned
+    with patch("main.STREAM_MAX_IN_FLIGHT", 1):
+        with client.websocket_connect("/ingest/stream", headers={"X-Tenant-ID": "test-tenant"}) as ws:
+            assert ws.receive_json()["credit"] == 1
+            ws.send_text('{"text": "first"}')
+            ws.send_text('{"text": "second"}')
+            with pytest.raises(WebSocketDisconnect) as exc:
+                ws.receive_json()
+            assert exc.value.code == 1008
+    assert mock_publisher.publish.call_count == 1
+
+def test_ingest_stream_connections_share_budget(pending_publishes, publish_budget):
+    budget = PublishBudget(8, reserve=2)
+    with patch("main.publish_budget", budget):
+        with client.websocket_connect("/ingest/stream", headers={"X-Tenant-ID": "tenant-a"}) as a:
+            # tenant-a stays idle, holding everything but the HTTP reserve
+            assert a.receive_json()["credit"] == 6
+            response = client.post("/ingest", json={"tenant_id": "t1", "log_id": "l1", "text": "log"})
+            assert response.status_code == 202
+
+            with client.websocket_connect("/ingest/stream", headers={"X-Tenant-ID": "tenant-b"}) as b:
+                assert b.receive_json()["credit"] == 0
+                # tenant-a gives back the part of its credit above its new share,
+                # which tenant-b then receives
+                assert a.receive_json() == {"type": "ack", "seq": 0, "credit": -3}
+                assert b.receive_json() == {"type": "ack", "seq": 0, "credit": 3}
+
+                b.send_text('{"text": "first"}')
+                wait_for_publishes(pending_publishes, 2)
+                pending_publishes[1].set_result("message-id")
+                receive_ack(b, 1)
+                assert budget.stream_in_flight <= budget.stream_limit
+
+def test_ingest_stream_idle_credit_reclaimed(stream_publisher, publish_budget):
+    with patch("main.STREAM_IDLE_SECONDS", 0.1):
+        with client.websocket_connect("/ingest/stream", headers={"X-Tenant-ID": "test-tenant"}) as ws:
+            credit = ws.receive_json()["credit"]
+            assert credit == 10
+            ws.send_text('{"text": "first"}')
+            credit += receive_ack(ws, 1) - 1
+            # Granted the full share while sending
+            assert credit == publish_budget.stream_share()
+            # Shrunk back to the idle credit once the stream stops sending
+            while credit > 10:
+                credit += ws.receive_json()["credit"]
+            assert credit == 10
+            assert publish_budget.in_flight == 10
+
+def test_ingest_stream_publish_failure(pending_publishes):
+    with patch("main.logger") as mock_logger:
+        with client.websocket_connect("/ingest/stream", headers={"X-Tenant-ID": "test-tenant"}) as ws:
+            ws.receive_json()
+            for i in range(3):
+                ws.send_text(json.dumps({"text": f"record {i}"}))
+            wait_for_publishes(pending_publishes, 3)
+
+            # Record 2 fails while record 1 is still publishing
+            pending_publishes[1].set_exception(RuntimeError("publish failed"))
+            pending_publishes[2].set_result("message-id")
+            # Records sent after the failure are not published
+            ws.send_text(json.dumps({"text": "record 3"}))
+            time.sleep(0.1)
+            pending_publishes[0].set_result("message-id")
+            # The earlier record is acked before the connection closes
+            receive_ack(ws, 1)
+            with pytest.raises(WebSocketDisconnect) as exc:
+                ws.receive_json()
+            assert exc.value.code == 1011
+            assert len(pending_publishes) == 3
+    errors = [str(c) for c in mock_logger.error.call_args_list]
+    assert not any("Internal error" in e for e in errors)
+
+@pytest.mark.parametrize("hello", ['{"tenant_id": 123}', '{"tenant_id": ["a"]}', '["frame-tenant"]', 'not json'])
+def test_ingest_stream_invalid_hello(publish_budget, hello):
+    with client.websocket_connect("/ingest/stream") as ws:
+        ws.send_text(hello)
+        with pytest.raises(WebSocketDisconnect) as exc:
+            ws.receive_json()
+        assert exc.value.code == 1008
+    assert publish_budget.streams == 0
+
+def test_ingest_stream_hello_timeout(publish_budget):
+    with patch("main.STREAM_HELLO_TIMEOUT", 0.05):
+        with client.websocket_connect("/ingest/stream") as ws:
+            with pytest.raises(WebSocketDisconnect) as exc:
+                ws.receive_json()
+            assert exc.value.code == 1008
+
+@pytest.fixture
+def search_index(tmp_path):
+    from search_index import SearchIndex
+    index = SearchIndex(str(tmp_path), flush_docs=2)
+    with patch("main.search_index", index):
+        yield index
+    index.close()
+
+def test_search_logs(search_index):
+    search_index.add("test-tenant", "log-1", "Login failed for alice")
+    search_index.add("test-tenant", "log-2", "Login ok for bob")
+    search_index.add("other-tenant", "log-3", "Login failed for alice")
+    search_index.flush()
+
+    response = client.get("/tenants/test-tenant/search", params={"q": "failed alice"})
+    assert response.status_code == 200
+    assert response.json() == {"tenant_id": "test-tenant", "log_ids": ["log-1"], "next_cursor": None}
+
+def test_search_logs_pagination(search_index):
+    for i in range(5):
+        search_index.add("test-tenant", f"log-{i}", "timeout error")
+    search_index.flush()
+
+    log_ids = []
+    params = {"q": "timeout", "limit": 2}
+    while True:
+        body = client.get("/tenants/test-tenant/search", params=params).json()
+        log_ids += body["log_ids"]
+        if body["next_cursor"] is None:
+            break
+        params["cursor"] = body["next_cursor"]
+    assert log_ids == [f"log-{i}" for i in range(5)]
+
+def test_search_logs_empty_query(search_index):
+    response = client.get("/tenants/test-tenant/search", params={"q": " "})
+    assert response.status_code == 400
+
+def test_search_logs_not_configured():
+    with patch("main.search_index", None):
+        response = client.get("/tenants/test-tenant/search", params={"q": "error"})
+    assert response.status_code == 500
@@ -0,0 +1,226 @@
+import pytest
+import os
+import math
+import random
+
+from search_index import IndexEvicted, SearchIndex, TenantIndex, Segment, _match, tokenize, write_segment
+
+@pytest.fixture
+def index(tmp_path):
+    index = SearchIndex(str(tmp_path), flush_docs=10, merge_factor=3)
+    yield index
+    index.close()
+
+def search_all(index, tenant_id, q, limit=7):
+    log_ids = []
+    cursor = None
+    while True:
+        page, cursor = index.search(tenant_id, q, limit, cursor)
+        log_ids += page
+        if cursor is None:
+            return log_ids
+
+def test_tokenize():
+    assert tokenize("Call me at [REDACTED], user_42!") == ["call", "me", "at", "redacted", "user_42"]
+
+def test_search_matches_all_terms(index):
+    random.seed(7)
+    words = ["alpha", "beta", "gamma", "error", "timeout"]
+    expected = {}
+    for i in range(500):
+        text = " ".join(random.sample(words, 3)) + f" user_{i % 13}"
+        index.add("acme", f"log-{i}", text)
+        expected[f"log-{i}"] = set(tokenize(text))
+    index.flush()
+    index.merge()
+
+    for q in ["error", "alpha timeout", "USER_3 error", "missing"]:
+        terms = set(tokenize(q))
+        assert search_all(index, "acme", q) == [log_id for log_id, t in expected.items() if terms <= t]
+
+def test_match_mixes_dense_and_sparse_blocks(tmp_path):
+    random.seed(11)
+    doc_count = 20000
+    # Densities on both sides of the bitmap threshold, including terms that
+    # are frequent but never occur together
+    postings = {
+        "dense": [d for d in range(doc_count) if random.random() < 0.9],
+        "medium": [d for d in range(doc_count) if random.random() < 0.05],
+        "sparse": [d for d in range(doc_count) if random.random() < 0.005],
+        "even": list(range(0, doc_count, 2)),
+        "odd": list(range(1, doc_count, 2)),
+        "late": list(range(doc_count - 300, doc_count)),
+    }
+    path = str(tmp_path / "seg.idx")
+    write_segment(path, [f"log-{d}" for d in range(doc_count)], sorted(postings.items()))
+    seg = Segment(path)
+
+    for terms in [["dense", "medium"], ["dense", "sparse"], ["medium", "sparse"], ["even", "odd"],
+                  ["even", "dense", "medium"], ["sparse", "late"], ["dense"]]:
+        for start in [0, 777, 19990]:
+            expected = sorted(set.intersection(*(set(postings[t]) for t in terms)))
+            expected = [d for d in expected if d >= start]
+            assert list(_match([seg.postings(t) for t in terms], start)) == expected
+        assert seg.postings(terms[0]).docs() == postings[terms[0]]
+    seg.close()
+
+def test_merge_keeps_cursor_stable(index):
+    for i in range(40):
+        index.add("acme", f"log-{i}", "disk full")
+    index.flush()
+    tenant = index.tenant("acme")
+    assert len(tenant._segments) == 4
+
+    first, cursor = index.search("acme", "disk", limit=15)
+    index.merge()
+    assert len(tenant._segments) < 3
+    second, _ = index.search("acme", "disk", limit=100, cursor=cursor)
+    assert first + second == [f"log-{i}" for i in range(40)]
+
+def test_tenants_are_isolated(index):
+    index.add("acme", "log-1", "secret error")
+    index.add("globex", "log-2", "secret error")
+    index.flush()
+    assert index.search("acme", "secret") == (["log-1"], None)
+    assert index.search("globex", "secret") == (["log-2"], None)
+    assert index.search("initech", "secret") == ([], None)
+
+def test_tenant_path_is_escaped(index, tmp_path):
+    index.add("../escape", "log-1", "hello")
+    index.flush()
+    assert os.listdir(tmp_path) == ["t_..%2Fescape"]
+
+def test_wal_replayed_after_restart(tmp_path):
+    index = TenantIndex(str(tmp_path), flush_docs=100)
+    index.add("log-1", "unflushed record")
+    # Simulate a crash: the buffered record only lives in the WAL
+    index._wal.close()
+
+    restarted = TenantIndex(str(tmp_path), flush_docs=100)
+    restarted.add("log-2", "unflushed record")
+    restarted.flush()
+    assert restarted.search("unflushed") == (["log-1", "log-2"], None)
+    restarted.close()
+
+def test_reader_sees_writer_segments(tmp_path):
+    writer = TenantIndex(str(tmp_path), flush_docs=1, merge_factor=2)
+    reader = TenantIndex(str(tmp_path))
+    writer.add("log-1", "connection refused")
+    assert reader.search("refused") == (["log-1"], None)
+
+    writer.add("log-2", "connection refused")
+    writer.merge()
+    assert reader.search("connection") == (["log-1", "log-2"], None)
+    writer.close()
+    reader.close()
+
+def test_merge_rewrites_each_doc_log_times(tmp_path):
+    docs = 20000
+    index = TenantIndex(str(tmp_path), flush_docs=100, merge_factor=8)
+    for i in range(docs):
+        index.add(f"log-{i}", "steady ingest")
+        if (i + 1) % 100 == 0:
+            while index.merge():
+                pass
+    # Every merge at least doubles a doc's segment, so it is rewritten at most
+    # log2(N / flush_docs) times; merging into one big segment would be O(N^2).
+    assert index.docs_merged <= docs * math.log2(docs / 100)
+    assert len(index._segments) <= 8 + math.log2(docs)
+    assert index.search("steady", limit=docs + 1)[0] == [f"log-{i}" for i in range(docs)]
+    index.close()
+
+def test_duplicate_log_across_page_boundary(index):
+    for i in range(3):
+        index.add("acme", f"log-{i}", "retry me")
+    index.flush()
+    # Pub/Sub redelivers log-1 and log-2 after the first flush
+    assert not index.add("acme", "log-1", "retry me")
+    index.add("acme", "log-3", "retry me")
+    assert not index.add("acme", "log-2", "retry me")
+    index.flush()
+
+    first, cursor = index.search("acme", "retry", limit=2)
+    second, cursor = index.search("acme", "retry", limit=2, cursor=cursor)
+    assert first == ["log-0", "log-1"]
+    assert second == ["log-2", "log-3"]
+    assert cursor is None
+
+def test_wal_replay_skips_flushed_records(tmp_path):
+    index = TenantIndex(str(tmp_path), flush_docs=100)
+    index.add("log-1", "flushed record")
+    index.flush()
+    # Simulate a crash after the manifest was written but before the WAL was truncated
+    index._wal.write('{"log_id": "log-1", "text": "flushed record"}\n')
+    index._wal.close()
+
+    restarted = TenantIndex(str(tmp_path), flush_docs=100)
+    restarted.add("log-2", "flushed record")
+    restarted.flush()
+    assert restarted.search("flushed") == (["log-1", "log-2"], None)
+    restarted.close()
+
+def test_missing_segment_fails_search(tmp_path):
+    writer = TenantIndex(str(tmp_path), flush_docs=1, merge_factor=100)
+    writer.add("log-1", "kept")
+    reader = TenantIndex(str(tmp_path))
+    assert reader.search("kept") == (["log-1"], None)
+
+    writer.add("log-2", "kept")
+    writer.add("log-3", "kept")
+    os.remove(writer._segments[1].path)
+
+    # Serving only the remaining segments would shift every cursor after the gap
+    for _ in range(2):
+        with pytest.raises(FileNotFoundError):
+            reader.search("kept")
+    with pytest.raises(FileNotFoundError):
+        TenantIndex(str(tmp_path)).search("kept")
+    writer.close()
+    reader.close()
+
+def test_idle_writers_are_evicted(tmp_path):
+    index = SearchIndex(str(tmp_path), flush_docs=100, max_tenants=2)
+    tenants = []
+    for i in range(5):
+        index.add(f"tenant-{i}", "log-1", "error")
+        tenants.append(index.tenant(f"tenant-{i}"))
+    assert len(index._tenants) == 2
+    # Evicted writers flushed their buffer and closed their WAL
+    assert [tenant.writable for tenant in tenants] == [False, False, False, True, True]
+    with pytest.raises(IndexEvicted):
+        tenants[0].add("log-2", "error")
+
+    reader = SearchIndex(str(tmp_path))
+    assert reader.search("tenant-0", "error") == (["log-1"], None)
+
+    # The next add reopens the writer
+    assert index.add("tenant-0", "log-1", "error") is False
+    assert index.add("tenant-0", "log-2", "error") is True
+    index.flush()
+    assert reader.search("tenant-0", "error") == (["log-1", "log-2"], None)
+    assert len(index._tenants) == 2
+    index.close()
+    reader.close()
+
+def test_search_after_close(tmp_path):
+    index = SearchIndex(str(tmp_path), flush_docs=1)
+    index.add("acme", "log-1", "error")
+    index.close()
+    assert index.search("acme", "error") == (["log-1"], None)
+    index.close()
+
+def test_unknown_tenants_are_not_cached(tmp_path):
+    index = SearchIndex(str(tmp_path), max_tenants=2)
+    for i in range(10):
+        assert index.search(f"made-up-{i}", "error") == ([], None)
+    assert len(index._tenants) == 0
+    assert os.listdir(tmp_path) == []
+
+    writer = SearchIndex(str(tmp_path), flush_docs=1)
+    for i in range(5):
+        writer.add(f"tenant-{i}", "log-1", "error")
+    for i in range(5):
+        assert index.search(f"tenant-{i}", "error") == (["log-1"], None)
+    assert len(index._tenants) == 2
+    writer.close()
+    index.close()